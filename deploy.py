@@ -13,11 +13,18 @@ Prerequisites:
     AWS credentials configured (aws configure / env vars / IAM role)
 """
 
+import functools
+import hashlib
+import os
 import sys
 import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
 
 import boto3
-from botocore.exceptions import ClientError
+from botocore.config import Config
+from botocore.exceptions import ClientError, WaiterError
 
 # ---------------------------------------------------------------------------
 # Configuration — edit these to match your deployment
@@ -48,6 +55,28 @@ S3_BUCKET_NAME = ""
 
 CAPABILITIES = ["CAPABILITY_NAMED_IAM"]
 
+# Templates under CloudFormation's inline TemplateBody limit skip the
+# staging bucket entirely; larger ones are uploaded and passed by URL.
+TEMPLATE_BODY_LIMIT = 51200
+
+# Stack-level statuses that end an operation, successfully or not
+TERMINAL_STACK_STATUSES = {
+    "CREATE_COMPLETE", "UPDATE_COMPLETE", "DELETE_COMPLETE",
+    "CREATE_FAILED", "UPDATE_FAILED", "DELETE_FAILED",
+    "ROLLBACK_COMPLETE", "ROLLBACK_FAILED",
+    "UPDATE_ROLLBACK_COMPLETE", "UPDATE_ROLLBACK_FAILED",
+}
+
+# Local marker files: staging buckets already known to exist (skips the
+# head_bucket check) and the template + parameter hash last deployed per
+# stack (skips no-op updates)
+CACHE_DIR = Path.home() / ".cache" / "gsi-deploy"
+
+# Bucket emptying on delete: DeleteObjects accepts at most 1000 keys per
+# request; batches are sent concurrently on the shared S3 client.
+DELETE_BATCH_SIZE = 1000
+DELETE_WORKERS = 16
+
 # ---------------------------------------------------------------------------
 # Helpers
 # ---------------------------------------------------------------------------
@@ -55,21 +84,50 @@ CAPABILITIES = ["CAPABILITY_NAMED_IAM"]
 def _region_kwargs():
     return {"region_name": REGION} if REGION else {}
 
+# The pool covers both buckets being emptied at once (delete workers plus
+# one listing thread each). Adaptive retries add client-side rate limiting
+# so repeated deploys back off instead of hammering throttled APIs.
+CLIENT_CONFIG = Config(
+    max_pool_connections=2 * (DELETE_WORKERS + 1),
+    retries={"max_attempts": 10, "mode": "adaptive"},
+)
+
+@functools.lru_cache(maxsize=1)
+def _session():
+    # One session for every client so credentials are resolved once; built
+    # on first use so a bad profile cannot break the usage text
+    return boto3.session.Session(**_region_kwargs())
+
+@functools.lru_cache(maxsize=1)
 def get_account_id():
-    sts = boto3.client("sts", **_region_kwargs())
+    sts = _session().client("sts", config=CLIENT_CONFIG)
     return sts.get_caller_identity()["Account"]
 
 def get_staging_bucket():
     return f"cfn-templates-{get_account_id()}".lower()
 
 def get_clients():
-    kwargs = _region_kwargs()
-    cfn = boto3.client("cloudformation", **kwargs)
-    s3 = boto3.client("s3", **kwargs)
+    cfn = _session().client("cloudformation", config=CLIENT_CONFIG)
+    s3 = _session().client("s3", config=CLIENT_CONFIG)
     return cfn, s3
 
 
+def _staging_marker(bucket):
+    return CACHE_DIR / f"{bucket}.ok"
+
+
+def _forget_staging_bucket(bucket):
+    try:
+        _staging_marker(bucket).unlink()
+    except OSError:
+        pass
+
+
 def ensure_staging_bucket(s3, bucket):
+    marker = _staging_marker(bucket)
+    if marker.exists():
+        print(f"  Staging bucket exists (cached): {bucket}")
+        return
     try:
         s3.head_bucket(Bucket=bucket)
         print(f"  Staging bucket exists: {bucket}")
@@ -82,17 +140,118 @@ def ensure_staging_bucket(s3, bucket):
                 "LocationConstraint": region
             }
         s3.create_bucket(**kwargs)
+    try:
+        marker.parent.mkdir(parents=True, exist_ok=True)
+        marker.touch()
+    except OSError:
+        pass  # cache is best-effort
+
+
+def _iter_bucket_objects(s3, bucket):
+    versioning = s3.get_bucket_versioning(Bucket=bucket).get("Status")
+    if versioning:
+        # Enabled or Suspended: every version and delete marker must go
+        paginator = s3.get_paginator("list_object_versions")
+        for page in paginator.paginate(Bucket=bucket):
+            for v in page.get("Versions", []) + page.get("DeleteMarkers", []):
+                yield {"Key": v["Key"], "VersionId": v["VersionId"]}
+    else:
+        paginator = s3.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=bucket):
+            for o in page.get("Contents", []):
+                yield {"Key": o["Key"]}
+
+
+def _delete_batch(s3, bucket, objects):
+    # Quiet mode: the response lists only the keys that failed. Low-level
+    # clients are thread-safe (Sessions and resources are not), so workers
+    # share the client created on the main thread and its credentials.
+    resp = s3.delete_objects(
+        Bucket=bucket, Delete={"Objects": objects, "Quiet": True})
+    return len(objects), resp.get("Errors", [])
+
+
+def empty_bucket(s3, bucket):
+    futures = []
+    batch = []
+    with ThreadPoolExecutor(max_workers=DELETE_WORKERS) as executor:
+        for obj in _iter_bucket_objects(s3, bucket):
+            batch.append(obj)
+            if len(batch) == DELETE_BATCH_SIZE:
+                futures.append(
+                    executor.submit(_delete_batch, s3, bucket, batch))
+                batch = []
+        if batch:
+            futures.append(executor.submit(_delete_batch, s3, bucket, batch))
+    deleted = 0
+    errors = []
+    for f in futures:
+        count, batch_errors = f.result()
+        deleted += count - len(batch_errors)
+        errors.extend(batch_errors)
+    print(f"  Deleted {deleted} object(s) from {bucket}")
+    for err in errors[:10]:
+        print(f"  Could not delete {err['Key']}: {err['Message']}")
+    if len(errors) > 10:
+        print(f"  ...and {len(errors) - 10} more")
+
+
+def _hash_file(path, *hashes):
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            for h in hashes:
+                h.update(chunk)
+
+
+@functools.lru_cache(maxsize=1)
+def _template_digests():
+    # One read of the template serves both the upload ETag check (MD5) and
+    # the deploy hash (SHA-256)
+    md5, sha256 = hashlib.md5(), hashlib.sha256()
+    _hash_file(TEMPLATE_FILE, md5, sha256)
+    return md5.hexdigest(), sha256.hexdigest()
 
 
 def upload_template(s3, bucket):
     key = f"{STACK_NAME}/template.yaml"
+    url = f"https://{bucket}.s3.amazonaws.com/{key}"
+    # The template is always sent as a single PUT, whose ETag is the MD5 of
+    # the body, so a matching ETag means the staged copy is identical.
+    try:
+        etag = s3.head_object(Bucket=bucket, Key=key)["ETag"].strip('"')
+    except ClientError:
+        etag = None
+    if etag == _template_digests()[0]:
+        print(f"  Template unchanged, skipping upload: s3://{bucket}/{key}")
+        return url
     print(f"  Uploading template to s3://{bucket}/{key}")
-    with open(TEMPLATE_FILE, "rb") as f:
-        s3.put_object(Bucket=bucket, Key=key, Body=f.read())
-    return f"https://{bucket}.s3.amazonaws.com/{key}"
+    size = os.path.getsize(TEMPLATE_FILE)
+    try:
+        # Streamed straight from the file handle; CloudFormation caps
+        # TemplateURL templates at 1 MB, so multipart is never worthwhile
+        with open(TEMPLATE_FILE, "rb") as f:
+            s3.put_object(Bucket=bucket, Key=key, Body=f, ContentLength=size)
+    except ClientError:
+        # The bucket may have been deleted since it was cached
+        _forget_staging_bucket(bucket)
+        raise
+    return url
+
+
+def prepare_template(s3):
+    if os.path.getsize(TEMPLATE_FILE) < TEMPLATE_BODY_LIMIT:
+        print("  Template is small enough to pass inline")
+        with open(TEMPLATE_FILE, encoding="utf-8") as f:
+            return {"TemplateBody": f.read()}
+    staging_bucket = get_staging_bucket()
+    ensure_staging_bucket(s3, staging_bucket)
+    return {"TemplateURL": upload_template(s3, staging_bucket)}
 
 
+@functools.lru_cache(maxsize=1)
 def build_params():
+    # Inputs are fixed for the life of the process; callers must not mutate
+    # the returned list.
     params = dict(PARAMETERS)
     if S3_BUCKET_NAME:
         params["S3BucketName"] = S3_BUCKET_NAME
@@ -104,62 +263,205 @@ def build_params():
     ]
 
 
+# describe_stacks responses keyed by stack name; dropped after any mutation
+_stack_cache = {}
+
+
+def _describe_stack(cfn, force=False):
+    if force or STACK_NAME not in _stack_cache:
+        _stack_cache[STACK_NAME] = cfn.describe_stacks(StackName=STACK_NAME)
+    return _stack_cache[STACK_NAME]
+
+
+def _invalidate_stack_cache():
+    _stack_cache.pop(STACK_NAME, None)
+
+
+def compute_deploy_hash(params):
+    h = hashlib.sha256(_template_digests()[1].encode())
+    for p in params:
+        h.update(f"{p['ParameterKey']}={p['ParameterValue']}\n".encode())
+    return h.hexdigest()[:16]
+
+
+def _deploy_marker():
+    region = _session().region_name
+    return CACHE_DIR / f"{STACK_NAME}-{get_account_id()}-{region}.deploy"
+
+
+def _stack_stamp(stack):
+    return (stack.get("LastUpdatedTime") or stack["CreationTime"]).isoformat()
+
+
+def deploy_is_current(cfn, deploy_hash):
+    # The marker only counts while the stack is exactly as this machine
+    # left it; an update from anywhere else moves LastUpdatedTime.
+    stack = _describe_stack(cfn)["Stacks"][0]
+    if stack["StackStatus"] not in ("CREATE_COMPLETE", "UPDATE_COMPLETE"):
+        return False
+    try:
+        recorded = _deploy_marker().read_text().split()
+    except OSError:
+        return False
+    return recorded == [deploy_hash, _stack_stamp(stack)]
+
+
+def record_deploy(cfn, deploy_hash):
+    stack = _describe_stack(cfn)["Stacks"][0]
+    marker = _deploy_marker()
+    try:
+        marker.parent.mkdir(parents=True, exist_ok=True)
+        marker.write_text(f"{deploy_hash} {_stack_stamp(stack)}\n")
+    except OSError:
+        pass  # cache is best-effort
+
+
+def _is_missing_stack_error(e):
+    err = e.response.get("Error", {})
+    return (err.get("Code") == "ValidationError"
+            and "does not exist" in err.get("Message", ""))
+
+
 def stack_exists(cfn):
     try:
-        resp = cfn.describe_stacks(StackName=STACK_NAME)
+        resp = _describe_stack(cfn)
         status = resp["Stacks"][0]["StackStatus"]
         return status not in ("DELETE_COMPLETE",)
     except ClientError as e:
-        if "does not exist" in str(e):
+        if _is_missing_stack_error(e):
             return False
         raise
 
 
-def wait_for_stack(cfn, waiter_name):
-    print(f"  Waiting for stack {waiter_name}...")
-    waiter = cfn.get_waiter(waiter_name)
+def _new_stack_events(cfn, token, seen):
+    # Events arrive newest first; page back only until reaching one already
+    # printed or one that belongs to an earlier operation.
+    new = []
+    paginator = cfn.get_paginator("describe_stack_events")
+    for page in paginator.paginate(StackName=STACK_NAME):
+        for ev in page["StackEvents"]:
+            if ev["EventId"] in seen or ev.get("ClientRequestToken") != token:
+                return new[::-1]
+            seen.add(ev["EventId"])
+            new.append(ev)
+    return new[::-1]
+
+
+def wait_for_stack(cfn, operation, token):
+    # Tail the stack events emitted by the operation started with `token`,
+    # backing off between polls, until the stack itself reaches a terminal
+    # status. Returns (status, reason) from the events already fetched, so
+    # callers need no further describe_stacks. CFN_WAITER_DELAY sets the
+    # first poll interval and CFN_WAIT_TIMEOUT (seconds) the ceiling.
+    delay = float(os.environ.get("CFN_WAITER_DELAY", "3"))
+    timeout = float(os.environ.get("CFN_WAIT_TIMEOUT", "3600"))
+    deadline = time.monotonic() + timeout
+    seen = set()
+    first_failure = ""
+    print(f"  Waiting for stack {operation.lower()}...")
+    while True:
+        try:
+            events = _new_stack_events(cfn, token, seen)
+        except ClientError as e:
+            # A deleted stack can no longer be looked up by name
+            if operation == "DELETE" and _is_missing_stack_error(e):
+                return "DELETE_COMPLETE", ""
+            return "UNKNOWN", str(e)
+        for ev in events:
+            status = ev["ResourceStatus"]
+            reason = ev.get("ResourceStatusReason", "")
+            print(f"  {ev['Timestamp']:%H:%M:%S}  "
+                  f"{ev['LogicalResourceId']:30s} {status}"
+                  f"{'  ' + reason if reason else ''}")
+            if status.endswith("_FAILED") and reason and not first_failure:
+                first_failure = f"{ev['LogicalResourceId']}: {reason}"
+            if (ev["LogicalResourceId"] == STACK_NAME
+                    and ev["ResourceType"] == "AWS::CloudFormation::Stack"
+                    and status in TERMINAL_STACK_STATUSES):
+                if status == f"{operation}_COMPLETE":
+                    return status, reason
+                return status, first_failure or reason
+        if time.monotonic() >= deadline:
+            return "TIMEOUT", f"No terminal status after {timeout:.0f}s"
+        time.sleep(delay)
+        delay = min(delay * 1.3, 15)
+
+
+def _delete_change_set(cfn, name):
+    try:
+        cfn.delete_change_set(StackName=STACK_NAME, ChangeSetName=name)
+    except ClientError:
+        pass  # best-effort; a leftover change set is harmless
+
+
+def create_update_change_set(cfn, template_kwargs, params):
+    # Returns (name, reason). An empty diff — which CloudFormation reports
+    # as a FAILED change set — gives (None, ""); any other failure gives
+    # (None, reason). Change sets that are not executed are deleted.
+    name = f"cs-{int(time.time())}"
+    try:
+        cfn.create_change_set(
+            StackName=STACK_NAME,
+            ChangeSetName=name,
+            ChangeSetType="UPDATE",
+            **template_kwargs,
+            Parameters=params,
+            Capabilities=CAPABILITIES,
+        )
+    except ClientError as e:
+        return None, e.response.get("Error", {}).get("Message", str(e))
+    waiter = cfn.get_waiter("change_set_create_complete")
     try:
         waiter.wait(
             StackName=STACK_NAME,
-            WaiterConfig={"Delay": 10, "MaxAttempts": 120},
+            ChangeSetName=name,
+            WaiterConfig={"Delay": 3, "MaxAttempts": 200},
         )
-        print(f"  Stack {waiter_name} complete.")
-        return True
-    except Exception as e:
-        print(f"  Stack operation failed: {e}")
-        return False
+    except WaiterError as e:
+        _delete_change_set(cfn, name)
+        reason = (e.last_response or {}).get("StatusReason") or str(e)
+        if ("didn't contain changes" in reason
+                or "No updates are to be performed" in reason):
+            return None, ""
+        return None, reason
+    return name, ""
 
 
 def print_outputs(cfn):
     try:
-        resp = cfn.describe_stacks(StackName=STACK_NAME)
-        outputs = resp["Stacks"][0].get("Outputs", [])
+        resp = _describe_stack(cfn)
+        outputs = {o["OutputKey"]: o["OutputValue"]
+                   for o in resp["Stacks"][0].get("Outputs", [])}
         if not outputs:
             print("  No outputs found.")
             return
         print("\n  Stack Outputs:")
         print("  " + "-" * 70)
-        for o in outputs:
-            key = o["OutputKey"]
-            val = o["OutputValue"]
+        for key, val in outputs.items():
             print(f"  {key:30s} {val}")
-            if key == "ReportDashboardURL":
-                print(f"\n  >>> Dashboard URL: {val}")
+        url = outputs.get("ReportDashboardURL")
+        if url:
+            print(f"\n  >>> Dashboard URL: {url}")
         print("  " + "-" * 70)
     except ClientError as e:
         print(f"  Error: {e}")
 
 
+def _print_stack_status(name, status, reason=""):
+    print(f"  Stack:  {name}")
+    print(f"  Status: {status}")
+    if reason:
+        print(f"  Reason: {reason}")
+
+
 def print_status(cfn):
     try:
-        resp = cfn.describe_stacks(StackName=STACK_NAME)
+        resp = _describe_stack(cfn)
         stack = resp["Stacks"][0]
-        print(f"  Stack:  {stack['StackName']}")
-        print(f"  Status: {stack['StackStatus']}")
-        if "StackStatusReason" in stack:
-            print(f"  Reason: {stack['StackStatusReason']}")
+        _print_stack_status(stack["StackName"], stack["StackStatus"],
+                            stack.get("StackStatusReason", ""))
     except ClientError as e:
-        if "does not exist" in str(e):
+        if _is_missing_stack_error(e):
             print(f"  Stack '{STACK_NAME}' does not exist.")
         else:
             print(f"  Error: {e}")
@@ -173,50 +475,70 @@ def cmd_deploy():
     cfn, s3 = get_clients()
     print(f"\nDeploying stack: {STACK_NAME}")
 
-    staging_bucket = get_staging_bucket()
-    ensure_staging_bucket(s3, staging_bucket)
-    template_url = upload_template(s3, staging_bucket)
-    params = build_params()
+    # Stack lookup overlaps STS; the account id is then cached for staging
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        f_exists = executor.submit(stack_exists, cfn)
+        params = build_params()
+        exists = f_exists.result()
+    deploy_hash = compute_deploy_hash(params)
+
+    # Checked before staging so a no-op deploy makes no S3 calls at all
+    if exists and deploy_is_current(cfn, deploy_hash):
+        print("  Template and parameters unchanged. Stack is up to date.")
+        print_outputs(cfn)
+        return
 
-    exists = stack_exists(cfn)
+    template_kwargs = prepare_template(s3)
+    token = str(uuid.uuid4())
 
     if exists:
-        print("  Stack exists — updating...")
-        try:
-            cfn.update_stack(
-                StackName=STACK_NAME,
-                TemplateURL=template_url,
-                Parameters=params,
-                Capabilities=CAPABILITIES,
-            )
-        except ClientError as e:
-            if "No updates are to be performed" in str(e):
-                print("  No changes detected. Stack is up to date.")
-                print_outputs(cfn)
-                return
-            raise
-        success = wait_for_stack(cfn, "stack_update_complete")
+        print("  Stack exists — creating change set...")
+        change_set, reason = create_update_change_set(
+            cfn, template_kwargs, params)
+        if change_set is None and reason:
+            print("\n  Deployment failed. "
+                  "Check the AWS CloudFormation console.")
+            stack = _describe_stack(cfn)["Stacks"][0]
+            _print_stack_status(STACK_NAME, stack["StackStatus"], reason)
+            sys.exit(1)
+        if change_set is None:
+            print("  No changes detected. Stack is up to date.")
+            record_deploy(cfn, deploy_hash)
+            print_outputs(cfn)
+            return
+        print(f"  Executing change set: {change_set}")
+        cfn.execute_change_set(
+            StackName=STACK_NAME,
+            ChangeSetName=change_set,
+            ClientRequestToken=token,
+        )
+        _invalidate_stack_cache()
+        operation = "UPDATE"
     else:
         print("  Creating new stack...")
         cfn.create_stack(
             StackName=STACK_NAME,
-            TemplateURL=template_url,
+            **template_kwargs,
             Parameters=params,
             Capabilities=CAPABILITIES,
+            ClientRequestToken=token,
         )
-        success = wait_for_stack(cfn, "stack_create_complete")
+        _invalidate_stack_cache()
+        operation = "CREATE"
 
-    if success:
+    status, reason = wait_for_stack(cfn, operation, token)
+    if status == f"{operation}_COMPLETE":
         print("\n  Deployment successful!")
+        record_deploy(cfn, deploy_hash)
         print_outputs(cfn)
     else:
         print("\n  Deployment failed. Check the AWS CloudFormation console.")
-        print_status(cfn)
+        _print_stack_status(STACK_NAME, status, reason)
         sys.exit(1)
 
 
 def cmd_delete():
-    cfn, _ = get_clients()
+    cfn, s3 = get_clients()
     if not stack_exists(cfn):
         print(f"  Stack '{STACK_NAME}' does not exist.")
         return
@@ -228,38 +550,46 @@ def cmd_delete():
         print("  Aborted.")
         return
 
-    # Empty S3 buckets first (CloudFormation can't delete non-empty buckets)
-    try:
-        resp = cfn.describe_stacks(StackName=STACK_NAME)
-        outputs = {o["OutputKey"]: o["OutputValue"]
-                   for o in resp["Stacks"][0].get("Outputs", [])}
-        s3r = boto3.resource("s3")
+    # Outputs come from the describe already cached by stack_exists and are
+    # shared by bucket emptying and workgroup deletion below
+    outputs = {o["OutputKey"]: o["OutputValue"]
+               for o in _describe_stack(cfn)["Stacks"][0].get("Outputs", [])}
+    if not outputs:
+        print("  No stack outputs; skipping bucket and workgroup cleanup.")
+
+    # Empty S3 buckets (CloudFormation can't delete non-empty buckets) and
+    # delete the Athena workgroup (may have query history) concurrently
+    tasks = {}
+    with ThreadPoolExecutor(max_workers=3) as executor:
         for key in ("ExportDataBucket", "AthenaResultsBucket"):
             bucket_name = outputs.get(key)
             if bucket_name:
                 print(f"  Emptying bucket: {bucket_name}")
-                bucket = s3r.Bucket(bucket_name)
-                bucket.objects.all().delete()
-    except Exception as e:
-        print(f"  Warning emptying buckets: {e}")
-
-    # Delete Athena workgroup (may have query history)
-    try:
-        athena = boto3.client("athena")
+                future = executor.submit(empty_bucket, s3, bucket_name)
+                tasks[future] = f"emptying {bucket_name}"
         wg = outputs.get("AthenaWorkgroup")
         if wg:
             print(f"  Deleting Athena workgroup: {wg}")
-            athena.delete_work_group(
+            athena = _session().client("athena", config=CLIENT_CONFIG)
+            future = executor.submit(
+                athena.delete_work_group,
                 WorkGroup=wg, RecursiveDeleteOption=True)
-    except Exception as e:
-        print(f"  Warning deleting workgroup: {e}")
-
-    cfn.delete_stack(StackName=STACK_NAME)
-    success = wait_for_stack(cfn, "stack_delete_complete")
-    if success:
+            tasks[future] = f"deleting workgroup {wg}"
+    for future, action in tasks.items():
+        try:
+            future.result()
+        except Exception as e:
+            print(f"  Warning {action}: {e}")
+
+    token = str(uuid.uuid4())
+    cfn.delete_stack(StackName=STACK_NAME, ClientRequestToken=token)
+    _invalidate_stack_cache()
+    status, reason = wait_for_stack(cfn, "DELETE", token)
+    if status == "DELETE_COMPLETE":
         print("  Stack deleted successfully.")
     else:
         print("  Delete may have failed. Check console.")
+        _print_stack_status(STACK_NAME, status, reason)
 
 
 def cmd_outputs():